@@ -47,22 +47,64 @@
 from __future__ import unicode_literals
 
 import collections
+import os
 import subprocess
 import sys
 
 PsResult = collections.namedtuple('PsResult', ['pid', 'ppid', 'command'])
 
-PS_PATTERN_FORMAT = 'ps -eo pid,ppid,args | grep {} | grep -v grep | grep -v findt'
-PS_PID_FORMAT = 'ps -o pid,ppid,args {}'
+PROC = '/proc'
 MAX_RECURSION = 8
 DEFAULT_TERM = 'rxvt'
 
+# filled in lazily by ps_map
+_procs = None
+
+def read_proc(pid):
+    """PsResult for one pid, read directly from /proc"""
+    with open('{}/{}/stat'.format(PROC, pid), 'rb') as fobj:
+        stat = fobj.read()
+    # the command name in parens may itself contain spaces and parens
+    comm_start = stat.index(b'(') + 1
+    comm_end = stat.rindex(b')')
+    ppid = stat[comm_end + 1:].split()[1].decode()
+    with open('{}/{}/cmdline'.format(PROC, pid), 'rb') as fobj:
+        cmdline = fobj.read()
+    command = cmdline.replace(b'\x00', b' ').strip()
+    if len(command) == 0:
+        # kernel threads have no command line, ps shows the name instead
+        command = b'[' + stat[comm_start:comm_end] + b']'
+    return PsResult(pid, ppid, command.decode('utf-8', 'replace'))
+
+
+def ps_map():
+    """All running processes, as {pid: PsResult}, read from /proc"""
+    global _procs
+    if _procs is not None:
+        return _procs
+    procs = {}
+    pids = [name for name in os.listdir(PROC) if name.isdigit()]
+    # same order as ps
+    for pid in sorted(pids, key=int):
+        try:
+            procs[pid] = read_proc(pid)
+        except (OSError, IndexError, ValueError):
+            # process exited while we were reading it
+            continue
+    _procs = procs
+    return procs
+
+
 def pattern_to_pid(pattern):
     try:
-        out = subprocess.check_output(
-            PS_PATTERN_FORMAT.format(pattern),
-            shell=True).decode()
-        return PsResult(*out.strip().split(None, 2))
+        for result in ps_map().values():
+            # match against the whole line, like grep on the ps output
+            line = ' '.join(result)
+            if 'grep' in line or 'findt' in line:
+                continue
+            if pattern in line:
+                return result
+        raise Exception('No match')
     except Exception as e:
         print('Cannot find process with pattern "{}"'.format(pattern))
         raise e
@@ -70,12 +112,8 @@ def pattern_to_pid(pattern):
 
 def expand_pid(pid):
     try:
-        out = subprocess.check_output(
-            PS_PID_FORMAT.format(pid),
-            shell=True).decode()
-        out = out.strip().split('\n')[-1]
-        return PsResult(*out.strip().split(None, 2))
-    except Exception as e:
+        return ps_map()[str(pid)]
+    except KeyError as e:
         print('Cannot find parent process using pid "{}"'.format(pid))
         raise e
         
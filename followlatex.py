@@ -49,13 +49,18 @@
 #   followlatex.py main.tex included_tikz_figure.tex
 #
 # Dependencies:
-#   envoy, inotify, latexrun, evince
+#   inotify, latexrun, evince
 
 import argparse
-import envoy
 import inotify.adapters
 import os
+import subprocess
 import sys
+import time
+
+# wait for this many seconds of quiet before recompiling,
+# so that a burst of saves results in a single compile
+DEBOUNCE_S = 0.2
 
 
 def tex(filename):
@@ -72,11 +77,15 @@ def swp(filename):
 
 class InotifyWrapper(object):
     def __init__(self):
-        self.ina = inotify.adapters.Inotify()
+        # wake up regularly, to fire debounced callbacks
+        self.ina = inotify.adapters.Inotify(block_duration_s=DEBOUNCE_S)
         # {path}
         self.directories = set()
         # {(dir, filename, mask) -> callback}
         self.callbacks = {}
+        # {callback -> latest event}, waiting for quiet
+        self.pending = {}
+        self.last_event_ts = None
         self.must_exit = False
 
     def directory(self, directory):
@@ -100,12 +109,20 @@ class InotifyWrapper(object):
 
     def event_loop(self):
         try:
-            for event in self.ina.event_gen():
+            for event in self.ina.event_gen(yield_nones=True):
                 if event is not None:
                     (header, type_names, watch_path, filename) = event
                     key = (watch_path, filename, header.mask)
                     if key in self.callbacks:
-                        self.callbacks[key](event)
+                        self.pending[self.callbacks[key]] = event
+                        self.last_event_ts = time.monotonic()
+                    continue
+                if (self.pending and
+                        time.monotonic() - self.last_event_ts >= DEBOUNCE_S):
+                    pending = self.pending
+                    self.pending = {}
+                    for callback, latest in pending.items():
+                        callback(latest)
         finally:
             self.close()
 
@@ -121,6 +138,11 @@ class LatexFollower(object):
         mainfilename = tex(mainfilename)
         self.sourcefilename = mainfilename
         self.renderfilename = pdf(mainfilename)
+        self.watched = [mainfilename]
+        if editfilename is not None:
+            self.watched.append(editfilename)
+        # mtimes of watched files at the last compile
+        self.rendered_mtimes = None
         self.evince = None
         self.launch()
 
@@ -135,17 +157,35 @@ class LatexFollower(object):
     def launch(self):
         #if not os.path.exists(self.renderfilename):
         self.render()
-        self.evince = envoy.connect('evince {}'.format(self.renderfilename))
+        self.evince = subprocess.Popen(['evince', self.renderfilename])
+
+    def mtimes(self):
+        result = []
+        for filename in self.watched:
+            try:
+                result.append(os.stat(filename).st_mtime_ns)
+            except OSError:
+                result.append(None)
+        return tuple(result)
 
     def render(self, event=None):
-        #envoy.run('xelatex -halt-on-error {}'.format(self.sourcefilename))
-        r = envoy.run('latexrun --latex-cmd xelatex {}'.format(self.sourcefilename))
+        mtimes = self.mtimes()
+        if mtimes == self.rendered_mtimes:
+            # nothing changed since the last compile
+            return
+        self.rendered_mtimes = mtimes
+        #subprocess.run(['xelatex', '-halt-on-error', self.sourcefilename])
+        r = subprocess.run(
+            ['latexrun', '--latex-cmd', 'xelatex', self.sourcefilename],
+            capture_output=True, text=True)
         # latexrun cleans up output, so we can show it here
-        print(r.std_out)
+        print(r.stdout)
 
     def exit(self, event=None):
         print('Must exit')
         self.iw.must_exit = True
+        if self.evince is not None:
+            self.evince.terminate()
 
 
 def get_parser():
@@ -52,6 +52,8 @@ import sys
 
 RE_NUMBER = re.compile(r'^([0-9]+)_(.*)')
 
+MAX_ERRORS = 30
+
 Action = collections.namedtuple('Action', ['frm', 'to'])
 
 parser = argparse.ArgumentParser(
@@ -86,12 +88,13 @@ class Renamer(object):
         #fnames = self.decode(fnames)
 
         fnames.sort()
-        local = []
+        # {to -> frm}
+        local = {}
         for frm in fnames:
             to = self.transform(frm)
             self.check(frm, to, local, dirname)
             # Unchanged files are added to local (can still conflict)
-            local.append(Action(frm, to))
+            local[to] = frm
             if frm == to:
                 # Unchanged files need not be scheduled for renaming though
                 continue
@@ -100,17 +103,17 @@ class Renamer(object):
                 os.path.join(dirname, to)))
 
     def check(self, frm, to, local, dirname):
-        for item in local:
-            if to == item.to:
-                print(
-                    'Conflict: "{}" and "{}" -> "{}"'.format(
-                        os.path.join(dirname, frm),
-                        os.path.join(dirname, item.frm),
-                        os.path.join(dirname, to)),
-                    file=sys.stderr)
-                self.failed += 1
-                if self.failed >= MAX_ERRORS:
-                    raise Exception('FATAL: too many errors')
+        prior = local.get(to)
+        if prior is not None:
+            print(
+                'Conflict: "{}" and "{}" -> "{}"'.format(
+                    os.path.join(dirname, frm),
+                    os.path.join(dirname, prior),
+                    os.path.join(dirname, to)),
+                file=sys.stderr)
+            self.failed += 1
+            if self.failed >= MAX_ERRORS:
+                raise Exception('FATAL: too many errors')
 
     def execute(self, func):
         assert self.failed == 0
@@ -119,8 +122,10 @@ class Renamer(object):
             func(action.frm, action.to)
 
 def inject_transform(index):
+    match = RE_NUMBER.match
+
     def inner(frm):
-        m = RE_NUMBER.match(frm)
+        m = match(frm)
         if not m:
             # non-numbered files are unchanged
             return frm
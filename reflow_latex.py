@@ -75,6 +75,10 @@ FUNC_WORDS = ['a', 'and', 'are', 'as', 'but', 'by', 'for', 'having',
               'were', 'where', 'when', 'which', 'with', 'without']
 DELIMS = ['{}', '()', '[]', ('``', "''")]
 
+FULLSTOP_CHARS = list(FULLSTOPS)
+COMMA_CHARS = list(COMMAS)
+FUNC_SET = frozenset(FUNC_WORDS)
+
 RE_COMMENT = re.compile(r'(?<!\\)%')
 RE_SINGLECOMMAND = re.compile(r'^\\.*}%?$')
 RE_ENDBREAK = re.compile(r'\\\\$')
@@ -82,13 +86,24 @@ RE_STARTSPACE = re.compile(r'^[ \t]')   # don't match newlines
 
 SHORT_DELIM = 4     # tokens
 
+# paragraphs this long are segmented with numba, if installed.
+# Importing numba takes longer than the NumPy DP on shorter ones.
+JIT_MIN_TOKENS = 10000
+
+# joining of spans
+FORBID = 0
+ALLOW = 1
+PREFER = 2
+
 # FIXME: unhandled patterns:
 # X, Y and Z
 # FIXME: de-fancify dashes and quotes
 
 class Span(object):
+    __slots__ = ('content', 'segment', 'join_left', 'join_right')
+
     def __init__(self, parts,
-                 segment=True, join_left='allow', join_right='allow'):
+                 segment=True, join_left=ALLOW, join_right=ALLOW):
         if isinstance(parts, str):
             self.content = parts
         else:
@@ -107,35 +122,39 @@ class Span(object):
 
 
 def paragraphs(lines, hyphenated=True):
+    startspace = RE_STARTSPACE.search
+    comment = RE_COMMENT.search
+    singlecommand = RE_SINGLECOMMAND.match
+    endbreak = RE_ENDBREAK.search
     current = []
     for line in lines:
-        if len(RE_STARTSPACE.findall(line)) > 0:
+        if startspace(line) is not None:
             # don't reflow indented lines?
             yield Span(current)
             yield Span(line.strip('\n'), segment=False,
-                       join_left='forbid', join_right='forbid')
+                       join_left=FORBID, join_right=FORBID)
             current = []
             continue
         line = line.strip()
         if len(line) == 0:
             yield Span(current)
             # blank lines indicate paragraph breaks
-            yield Span('', segment=False, join_right='forbid')
+            yield Span('', segment=False, join_right=FORBID)
             current = []
             continue
-        if len(RE_COMMENT.findall(line)) > 0:
+        if comment(line) is not None:
             yield Span(current)
             # don't reflow lines with comments
             # but allow appending comment to previous line
             yield Span(line, segment=False,
-                       join_left='prefer', join_right='forbid')
+                       join_left=PREFER, join_right=FORBID)
             current = []
             continue
-        if RE_SINGLECOMMAND.match(line):
+        if singlecommand(line) is not None:
             yield Span(current)
             # don't reflow single-command lines
             yield Span(line, segment=False,
-                       join_left='forbid', join_right='forbid')
+                       join_left=FORBID, join_right=FORBID)
             current = []
             continue
         sep = ' '
@@ -144,28 +163,27 @@ def paragraphs(lines, hyphenated=True):
             line = line[:-1]
         current.append(line)
         current.append(sep)
-        if len(RE_ENDBREAK.findall(line)) > 0:
+        if endbreak(line) is not None:
             # don't remove break after \\
-            yield Span(current, join_right='forbid')
+            yield Span(current, join_right=FORBID)
             current = []
     yield Span(current)
 
 
 def static_costs(line):
     """Static cost of breaking after the token at index."""
+    last_chars = np.array([token[-1:] for token in line], dtype=str)
+    func_mask = np.array([token.lower() in FUNC_SET for token in line],
+                         dtype=bool)
     costs = np.zeros(len(line))
+    costs += np.isin(last_chars, FULLSTOP_CHARS) * COST_FULLSTOP
+    costs += np.isin(last_chars, COMMA_CHARS) * COST_COMMA
+    costs[func_mask] -= COST_FUNC               # penalty after
+    costs[:-1][func_mask[1:]] += COST_FUNC      # bonus before
     open_delims = [None] * len(DELIMS)
     for (i, token) in enumerate(line):
         if len(token) == 0:
             continue
-        if token[-1] in FULLSTOPS:
-            costs[i] += COST_FULLSTOP
-        if token[-1] in COMMAS:
-            costs[i] += COST_COMMA
-        if token.lower() in FUNC_WORDS:
-            costs[i] -= COST_FUNC          # penalty after
-            if i > 0:
-                costs[i - 1] += COST_FUNC  # bonus before
         for (j, delim) in enumerate(DELIMS):
             if delim[0] in token and not delim[1] in token:
                 # opened but not immediately closed
@@ -177,36 +195,122 @@ def static_costs(line):
     return costs
 
 
-def line_cost(line):
-    n_chars = len(' '.join(line))
-    extra = COST_TOOLONG if n_chars > CHARS_MAX else 0
-    if n_chars > CHARS_LONG:
-        extra += COST_LONG
-    return np.abs(n_chars - CHARS_OPT) + COST_LINE + extra
-
-
 def noblank(tokens):
     return [x for x in tokens if len(x) > 0]
 
 
-def segment(line):
-    line = [''] + line
-    n_tokens = len(line)
-    scosts = static_costs(line)
-    dpcost = np.array([np.infty] * n_tokens)
+# DP work arrays, reused across paragraphs (grown as needed).
+# Safe because reflow is single-threaded,
+# and segment is done with them before returning.
+_BUFS = {
+    'pref': np.empty(0, dtype=np.int64),
+    'dpcost': np.empty(0, dtype=np.float64),
+    'dpback': np.empty(0, dtype=np.int64),
+}
+
+
+def _buffer(name, size):
+    buf = _BUFS[name]
+    if buf.size < size:
+        buf = np.empty(max(size, 2 * buf.size), dtype=buf.dtype)
+        _BUFS[name] = buf
+    return buf[:size]
+
+
+def _segment_numpy(tok_len, scosts, pref, dpcost, dpback):
+    """Segmentation DP over token lengths, vectorized over the line start.
+
+    Fills in pref (n_tokens + 1), dpcost and dpback (n_tokens).
+    """
+    n_tokens = len(tok_len)
+    # pref[k] is the number of chars in the first k tokens,
+    # so that tokens i+1 .. j-1 joined by spaces take
+    # pref[j] - pref[i + 1] + (j - i - 2) chars
+    pref[0] = 0
+    np.cumsum(tok_len, out=pref[1:])
     dpcost[0] = 0
-    dpback = np.zeros(n_tokens, dtype=int)
     dpback[0] = -1
-    current = np.zeros(n_tokens)
     for j in range(1, n_tokens):
-        current[:] = np.infty
-        for i in range(j):
-            start_to_i = dpcost[i]
-            i_to_j = line_cost(line[(i + 1):j])
-            current[i] = start_to_i + i_to_j
-        best = np.argmin(current)
+        i = np.arange(j)
+        n_chars = pref[j] - pref[i + 1] + np.maximum(j - i - 2, 0)
+        extra = np.where(n_chars > CHARS_MAX, COST_TOOLONG, 0.)
+        extra += np.where(n_chars > CHARS_LONG, COST_LONG, 0.)
+        i_to_j = np.abs(n_chars - CHARS_OPT) + COST_LINE + extra
+        current = dpcost[:j] + i_to_j
+        best = int(np.argmin(current))
         dpback[j] = best
         dpcost[j] = current[best] + scosts[j - 1]
+
+
+def _segment_core(tok_len, scosts, pref, dpcost, dpback,
+                  chars_opt, chars_max, chars_long,
+                  cost_line, cost_toolong, cost_long):
+    """Segmentation DP over token lengths, as scalar loops for numba.
+
+    Fills in pref (n_tokens + 1), dpcost and dpback (n_tokens).
+    """
+    n_tokens = len(tok_len)
+    # pref[k] is the number of chars in the first k tokens,
+    # so that tokens i+1 .. j-1 joined by spaces take
+    # pref[j] - pref[i + 1] + (j - i - 2) chars
+    pref[0] = 0
+    for k in range(n_tokens):
+        pref[k + 1] = pref[k] + tok_len[k]
+    dpcost[0] = 0
+    dpback[0] = -1
+    for j in range(1, n_tokens):
+        best = 0
+        best_cost = np.inf
+        for i in range(j):
+            n_chars = pref[j] - pref[i + 1] + max(j - i - 2, 0)
+            extra = cost_toolong if n_chars > chars_max else 0.
+            if n_chars > chars_long:
+                extra += cost_long
+            i_to_j = abs(n_chars - chars_opt) + cost_line + extra
+            current = dpcost[i] + i_to_j
+            if current < best_cost:
+                best = i
+                best_cost = current
+        dpback[j] = best
+        dpcost[j] = best_cost + scosts[j - 1]
+
+
+# None: not tried yet, False: numba is not installed
+_segment_jit = None
+
+def _jit_core():
+    """The numba-compiled _segment_core, or None if numba is missing.
+
+    numba is only imported when first needed,
+    as the import alone takes longer than typical input.
+    """
+    global _segment_jit
+    if _segment_jit is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _segment_jit = False
+        else:
+            _segment_jit = njit(cache=True)(_segment_core)
+    return _segment_jit or None
+
+
+def segment(line):
+    line = [''] + line
+    n_tokens = len(line)
+    scosts = static_costs(line)
+    tok_len = np.fromiter((len(t) for t in line), dtype=np.int32,
+                          count=n_tokens)
+    pref = _buffer('pref', n_tokens + 1)
+    dpcost = _buffer('dpcost', n_tokens)
+    dpback = _buffer('dpback', n_tokens)
+    core = _jit_core() if n_tokens >= JIT_MIN_TOKENS else None
+    if core is None:
+        _segment_numpy(tok_len, scosts, pref, dpcost, dpback)
+    else:
+        core(tok_len, scosts, pref, dpcost, dpback,
+             CHARS_OPT, CHARS_MAX, CHARS_LONG,
+             COST_LINE, COST_TOOLONG, COST_LONG)
     out = []
     prevcursor = n_tokens
     cursor = dpback[-1]
@@ -223,11 +327,11 @@ def join_spans(spans):
         if previous is None:
             previous = span
             continue
-        if previous.join_right == 'forbid':
+        if previous.join_right == FORBID:
             yield previous
             previous = span
             continue
-        if span.join_left == 'prefer':
+        if span.join_left == PREFER:
             previous.content.extend(span.content)
             continue
         yield previous
@@ -274,9 +378,12 @@ def main(argv):
         #outfile = codecs.getwriter('utf-8')(sys.stdout)
         outfile = sys.stdout
     else:
-        outfile = codecs.open(args.outfile, 'w', encoding='utf-8')
-    for item in reflow(infile.readlines()):
-        outfile.write(item)
+        outfile = open(args.outfile, 'w',
+                       buffering=1 << 16, encoding='utf-8')
+    # stream: output starts before the whole input has been read
+    outfile.writelines(reflow(infile))
+    if outfile is not sys.stdout:
+        outfile.close()
 
 
 if __name__ == '__main__':
@@ -53,7 +53,7 @@
 #       regexrename.py --cleanup
 
 import argparse
-import collections
+import functools
 import os
 import re
 import sys
@@ -71,8 +71,8 @@ CLEANUP_MAP = {
     '&': 'and'}
 
 MAX_ERRORS = 30
-
-Action = collections.namedtuple('Action', ['frm', 'to'])
+# filenames like README.md repeat across directories
+TRANSFORM_CACHE_SIZE = 100000
 
 parser = argparse.ArgumentParser(
     prog='regexrename',
@@ -95,9 +95,13 @@ parser.add_argument('to', metavar='to', type=str, nargs='?')
 
 class Renamer(object):
     def __init__(self, transform):
+        # [(frm, to)]
         self.schedule = []
-        self.transform = transform
+        self.transform = functools.lru_cache(
+            maxsize=TRANSFORM_CACHE_SIZE)(transform)
         self.failed = 0
+        # conflict messages, written out at once by report
+        self.errors = []
 
     #def decode(self, fnames):
     #    result = []
@@ -110,41 +114,138 @@ class Renamer(object):
     #            raise e
     #    return result
 
-    def visit(self, dirname, fnames):
+    def visit(self, dirname, fnames, others=()):
+        """Schedule renaming of fnames in dirname.
+
+        others are the names of any other entries in dirname,
+        which are not renamed but must not be overwritten.
+        """
         #fnames = self.decode(fnames)
 
         fnames.sort()
-        local = []
+        # for join, computed once
+        if len(dirname) == 0 or dirname.endswith(os.sep):
+            prefix = dirname
+        else:
+            prefix = dirname + os.sep
+        # bound once, outside the per-file loop
+        transform = self.transform
+        check = self.check
+        schedule = self.schedule.append
+        failed_before = self.failed
+        # {to -> frm}
+        local = {}
+        # [(frm, to)] in this directory
+        renamed = []
         for frm in fnames:
-            to = self.transform(frm)
-            self.check(frm, to, local, dirname)
+            to = transform(frm)
+            check(frm, to, local, prefix)
             # Unchanged files are added to local (can still conflict)
-            local.append(Action(frm, to))
+            local[to] = frm
             if frm == to:
                 # Unchanged files need not be scheduled for renaming though
                 continue
-            self.schedule.append(Action(
-                os.path.join(dirname, frm),
-                os.path.join(dirname, to)))
-
-    def check(self, frm, to, local, dirname):
-        for item in local:
-            if to == item.to:
-                print(
-                    'Conflict: "{}" and "{}" -> "{}"'.format(
-                        os.path.join(dirname, frm),
-                        os.path.join(dirname, item.frm),
-                        os.path.join(dirname, to)),
-                    file=sys.stderr)
+            renamed.append((frm, to))
+            schedule((prefix + frm, join(prefix, to)))
+        if self.failed == failed_before:
+            self.check_existing(renamed, fnames, others, prefix)
+
+    def check(self, frm, to, local, prefix):
+        prior = local.get(to)
+        if prior is not None:
+            self.errors.append(
+                'Conflict: "{}{}" and "{}{}" -> "{}"'.format(
+                    prefix, frm, prefix, prior, join(prefix, to)))
+            self.failed += 1
+            if self.failed >= MAX_ERRORS:
+                raise Exception('FATAL: too many errors')
+
+    def check_existing(self, renamed, fnames, others, prefix):
+        """Check that no rename overwrites an existing entry.
+
+        A name may be reused if its file has been renamed away first,
+        so this follows the order in which execute will do the renames.
+        """
+        names = set(fnames)
+        names.update(others)
+        for (frm, to) in reversed(renamed):
+            if os.path.dirname(to):
+                # target in another directory (or absolute), whose names
+                # are not known here, so check the filesystem instead
+                exists = os.path.lexists(join(prefix, to))
+            else:
+                exists = to in names
+            if exists:
+                self.errors.append(
+                    'Conflict: "{}{}" -> "{}" already exists'.format(
+                        prefix, frm, join(prefix, to)))
                 self.failed += 1
                 if self.failed >= MAX_ERRORS:
                     raise Exception('FATAL: too many errors')
+            names.discard(frm)
+            names.add(to)
+
+    def report(self):
+        if len(self.errors) > 0:
+            sys.stderr.write('\n'.join(self.errors) + '\n')
+            self.errors = []
 
     def execute(self, func):
         assert self.failed == 0
         # reversed, so nested files are renamed before containing dir
-        for action in reversed(self.schedule):
-            func(action.frm, action.to)
+        for (frm, to) in reversed(self.schedule):
+            func(frm, to)
+
+
+def join(prefix, name):
+    """Same as os.path.join(dirname, name), for prefix computed by visit.
+
+    An absolute name replaces the directory, as in os.path.join.
+    """
+    if os.path.isabs(name):
+        return name
+    return prefix + name
+
+
+def walk(top):
+    """Like os.walk, yields (dirpath, dirnames, filenames).
+
+    Uses the file type from the directory read, to avoid a stat per entry.
+    """
+    stack = [top]
+    while stack:
+        dirpath = stack.pop()
+        dirnames = []
+        filenames = []
+        subdirs = []
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            # unreadable dirs are skipped, as in os.walk
+            continue
+        with entries:
+            for entry in entries:
+                # as in os.walk, an entry that can not be checked
+                # is taken to be a non-directory
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    filenames.append(entry.name)
+                    continue
+                # like os.walk, symlinks to dirs are listed as dirs,
+                # but are not descended into
+                dirnames.append(entry.name)
+                try:
+                    walk_into = not entry.is_symlink()
+                except OSError:
+                    walk_into = False
+                if walk_into:
+                    subdirs.append(entry.path)
+        yield dirpath, dirnames, filenames
+        # top-down, in directory order
+        stack.extend(reversed(subdirs))
 
 
 def regex_transform(pattern, to):
@@ -152,15 +253,31 @@ def regex_transform(pattern, to):
 
     def inner(frm):
         return regex.sub(to, frm)
+
+    if '\\' in to:
+        # replacement uses escapes or backreferences
+        return inner
+    # specialized versions of common simple patterns,
+    # avoiding the overhead of the regex engine
+    if pattern == '^':
+        return lambda frm: to + frm
+    if pattern == '$':
+        # $ also matches before a trailing newline
+        return lambda frm: inner(frm) if frm.endswith('\n') else frm + to
+    if re.escape(pattern) == pattern:
+        # nothing special in the pattern, it is a plain string
+        return lambda frm: frm.replace(pattern, to)
     return inner
 
 
+def cleanup_replacement(match):
+    return CLEANUP_MAP.get(match.group(0), '_')
+
+
 def cleanup_transform(frm):
-    to = frm
-    for (a, b) in CLEANUP_MAP.items():
-        to = to.replace(a, b)
-    to = RE_UNWANTED.sub('_', to)
-    return to
+    # all CLEANUP_MAP keys are also unwanted characters,
+    # so a single pass over the string handles both
+    return RE_UNWANTED.sub(cleanup_replacement, frm)
 
 
 def dryrun(frm, to):
@@ -168,10 +285,44 @@ def dryrun(frm, to):
 
 
 def rename(frm, to):
-    assert not os.path.exists(to)
+    # os.rename silently replaces an existing file
+    if os.path.lexists(to):
+        raise Exception('will not overwrite existing "{}"'.format(to))
     os.rename(frm, to)
 
 
+class DirRenamer(object):
+    """Renames relative to an open fd of the containing directory.
+
+    The schedule renames all files of a directory in a row,
+    so the kernel only needs to resolve the directory path once.
+    """
+    def __init__(self):
+        self.dirname = None
+        self.fd = None
+
+    def __call__(self, frm, to):
+        dirname, frm_base = os.path.split(frm)
+        to_dirname, to_base = os.path.split(to)
+        if to_dirname != dirname or os.rename not in os.supports_dir_fd:
+            # checks that to does not exist
+            rename(frm, to)
+            return
+        # Renamer.check_existing has made sure that to_base does not exist
+        if dirname != self.dirname:
+            self.close()
+            self.fd = os.open(dirname or '.', os.O_RDONLY | os.O_DIRECTORY)
+            self.dirname = dirname
+        os.rename(frm_base, to_base,
+                  src_dir_fd=self.fd, dst_dir_fd=self.fd)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.dirname = None
+        self.fd = None
+
+
 def main(args):
     if args.cleanup and (args.frm is not None or args.to is not None):
         raise Exception('cleanup can not be used with from and to')
@@ -186,19 +337,26 @@ def main(args):
         trafo = regex_transform(args.frm, args.to)
     r = Renamer(trafo)
 
-    if args.shallow:
-        r.visit('.', os.listdir('.'))
-    else:
-        for dirpath, _, filenames in os.walk(str('.')):
-            r.visit(dirpath, filenames)
+    try:
+        if args.shallow:
+            r.visit('.', os.listdir('.'))
+        else:
+            for dirpath, dirnames, filenames in walk('.'):
+                r.visit(dirpath, filenames, dirnames)
+    finally:
+        # also when stopping at MAX_ERRORS
+        r.report()
 
     if r.failed > 0:
         raise Exception('Conflicts detected, will not rename')
     if args.dryrun:
-        func = dryrun
-    else:
-        func = rename
-    r.execute(func)
+        r.execute(dryrun)
+        return
+    func = DirRenamer()
+    try:
+        r.execute(func)
+    finally:
+        func.close()
 
 if __name__ == '__main__':
     main(parser.parse_args(sys.argv[1:]))
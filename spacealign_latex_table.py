@@ -47,49 +47,64 @@
 
 import sys
 
-def column_widths(lines):
-    for line in lines:
-        columns = line.split('&')
-        if len(columns) < 2:
-            continue
-        stripped = [col.strip() for col in columns]
-        widths = [len(col) for col in stripped]
-        yield widths
+def split_rows(lines):
+    """Stripped columns of each line, split only once"""
+    return [[col.strip() for col in line.split('&')]
+            for line in lines]
 
-def max_widths(all_widths):
-    # transpose from by-rows to by-cols
-    by_col = list(zip(*all_widths))
-    widths = [max(col) for col in by_col]
+def max_widths(rows):
+    # running max over rows with at least two columns,
+    # limited to the number of columns of the shortest such row
+    widths = None
+    for stripped in rows:
+        if len(stripped) < 2:
+            continue
+        if widths is None:
+            widths = [len(col) for col in stripped]
+            continue
+        if len(stripped) < len(widths):
+            del widths[len(stripped):]
+        for (i, col) in enumerate(stripped[:len(widths)]):
+            if len(col) > widths[i]:
+                widths[i] = len(col)
+    if widths is None:
+        return []
     return widths
 
 def make_formats(widths):
-    formats = [' {:' + str(w) + '} ' if w > 0 else ''
-               for w in widths]
+    formats = []
+    last = len(widths) - 1
+    for (i, w) in enumerate(widths):
+        if w == 0:
+            formats.append('')
+            continue
+        fmt = '{:' + str(w) + '}'
+        # no extra space at ends
+        if i > 0:
+            fmt = ' ' + fmt
+        if i < last:
+            fmt = fmt + ' '
+        formats.append(fmt)
     return formats
 
-def reformat(lines, formats):
-    for line in lines:
-        columns = line.split('&')
-        stripped = [col.strip() for col in columns]
-        if len(columns) != len(formats):
+def reformat(lines, rows, formats):
+    for (line, stripped) in zip(lines, rows):
+        if len(stripped) != len(formats):
             yield line
             continue
-        reformatted = [fmt.format(col)
+        yield '&'.join(fmt.format(col)
                        for (fmt, col)
-                       in zip(formats, stripped)]
-        joined = '&'.join(reformatted)
-        # extra space at ends
-        joined = joined[1:-1]
-        yield joined
+                       in zip(formats, stripped))
 
 def main():
     lines = sys.stdin
     lines = [line.rstrip('\n') for line in lines]
-    all_widths = column_widths(lines)
-    widths = max_widths(all_widths)
+    rows = split_rows(lines)
+    widths = max_widths(rows)
     formats = make_formats(widths)
-    for line in reformat(lines, formats):
-        print(line)
+    # same size as the input, which is already in memory
+    sys.stdout.write(''.join(line + '\n'
+                             for line in reformat(lines, rows, formats)))
 
 
 if __name__ == '__main__':
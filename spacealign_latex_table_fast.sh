@@ -0,0 +1,12 @@
+#!/bin/bash
+set -eu
+
+# Runs spacealign_latex_table.py under PyPy if it is installed,
+# otherwise falls back to CPython.
+# The tool is plain string handling, which PyPy's JIT speeds up a lot
+# for very large tables.
+here=$(dirname "$(readlink -f "$0")")
+if command -v pypy3 > /dev/null; then
+    exec pypy3 "${here}/spacealign_latex_table.py" "$@"
+fi
+exec python3 "${here}/spacealign_latex_table.py" "$@"